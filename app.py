@@ -1,9 +1,8 @@
 import streamlit as st
-import json
 import uuid
+import calendar
 from datetime import datetime, timedelta
 import logging
-import base64
 import plotly.express as px
 import pandas as pd
 import smtplib
@@ -12,7 +11,14 @@ from email.mime.multipart import MIMEMultipart
 from jinja2 import Template
 import folium
 from streamlit_folium import folium_static
-import requests
+from search_index import EventSearchIndex
+from event_index import EventTimeline
+from participants import ParticipantIndex, PAGE_SIZE, query_participants, participants_csv
+from occupancy import OccupancyCube, LEVELS
+from static_assets import page_style
+from geocoding import GeocodingWorker, event_coordinates
+from change_feed import SharedStore
+from serialization import load_store, save_store, export_json, use_snapshots
 
 # Constants
 EVENTS_FILE = 'events.json'
@@ -21,6 +27,7 @@ SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "admin123"  # In production, use hashed passwords
+SEARCH_LIMIT = 50
 
 # Email templates at the top level
 REGISTRATION_TEMPLATE = """
@@ -82,26 +89,37 @@ logging.basicConfig(
 # Utility functions
 def load_json(filename):
     try:
-        with open(filename, 'r') as f:
-            return json.load(f)
+        return load_store(filename)
     except FileNotFoundError:
         logging.warning(f"File {filename} not found. Creating new.")
         return {}
-    except json.JSONDecodeError:
+    except ValueError:
+        # Don't start from an empty store, the next save would overwrite the file
         logging.error(f"Invalid JSON in {filename}")
-        return {}
+        raise
 
 def save_json(data, filename):
     try:
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=4)
+        save_store(data, filename)
         return True
     except Exception as e:
         logging.error(f"Failed to save {filename}: {str(e)}")
         return False
 
+def export_readable_json():
+    """Write readable JSON copies of the data files, for admins when binary snapshots are on"""
+    try:
+        # Hold the store lock so both files reflect the same moment
+        with store.transaction():
+            export_json(store.data['events'], EVENTS_FILE)
+            export_json(store.data['registrations'], REGISTRATIONS_FILE)
+        return True
+    except Exception as e:
+        logging.error(f"Failed to export JSON: {str(e)}")
+        return False
+
 def get_event_participants(event_id):
-    return [r for r in registrations.values() if r['event_id'] == event_id]
+    return participant_index.for_event(event_id)
 
 def send_registration_email(recipient_email, event_name, event_date, event_time, event_location):
     try:
@@ -144,32 +162,21 @@ def send_registration_email(recipient_email, event_name, event_date, event_time,
 
 def delete_event(event_id):
     try:
-        # Delete the event
-        if event_id in events:
-            del events[event_id]
+        with store.transaction() as tx:
+            # Delete the event
+            if event_id not in store.data['events']:
+                return False
+            tx.delete('events', event_id)
             # Delete all registrations for this event
-            global registrations
-            registrations = {k: v for k, v in registrations.items() if v['event_id'] != event_id}
-            # Save changes
-            return save_json(events, EVENTS_FILE) and save_json(registrations, REGISTRATIONS_FILE)
+            for reg_id in participant_index.registration_ids(event_id):
+                tx.delete('registrations', reg_id)
+        # Changes are saved and published to other replicas when the transaction ends
+        return tx.ok
     except Exception as e:
         logging.error(f"Failed to delete event: {str(e)}")
         return False
     return False
 
-def get_location_coordinates(location):
-    """Get coordinates for a location using OpenStreetMap Nominatim API"""
-    try:
-        url = f"https://nominatim.openstreetmap.org/search?q={location}&format=json"
-        response = requests.get(url)
-        data = response.json()
-        if data:
-            return float(data[0]['lat']), float(data[0]['lon'])
-        return None
-    except Exception as e:
-        logging.error(f"Failed to get coordinates: {str(e)}")
-        return None
-
 def send_templated_email(template_str, recipient_email, **kwargs):
     """Send templated email using provided template and kwargs"""
     try:
@@ -195,10 +202,11 @@ def send_templated_email(template_str, recipient_email, **kwargs):
         logging.error(f"Failed to send templated email: {str(e)}")
         return False
 
-def display_location_map(location):
-    """Create and display a map for the given location with error handling"""
+def display_location_map(event):
+    """Create a map for the event's location once the geocoding worker has resolved it"""
+    location = event['location']
     try:
-        coords = get_location_coordinates(location)
+        coords = event_coordinates(event)
         if coords:
             m = folium.Map(location=coords, zoom_start=15)
             folium.Marker(
@@ -227,111 +235,118 @@ def safe_rerun():
     except Exception as e:
         logging.warning(f"Rerun failed: {str(e)}. Please refresh the page manually.")
 
-def show_participants_modal(event_name, participants):
-    """Display participants in a more organized way"""
-    if st.button(f"👥 View Participants ({len(participants)})", key=f"view_part_{event_name}"):
+def show_participants_modal(event_id, event_name):
+    """Display participants as a paginated table, sending only the visible page"""
+    # Only the count is needed until the table is opened
+    if st.toggle(f"👥 View Participants ({participant_index.count(event_id)})", key=f"view_part_{event_id}"):
         st.markdown(f"### Participants for {event_name}")
-        if participants:
-            for p in participants:
-                st.markdown(f"""
-                * **Name:** {p['name']}
-                * **Email:** {p['email']}
-                * **Phone:** {p.get('phone', 'Not provided')}
-                ---
-                """)
-        else:
+        participants = get_event_participants(event_id)
+        if not participants:
             st.info("No participants registered yet")
+            return
+        
+        search = st.text_input("Filter by name or email", key=f"part_search_{event_id}")
+        sort_by = st.selectbox(
+            "Sort by",
+            ["timestamp", "name", "email"],
+            format_func=lambda f: {"timestamp": "Registration time", "name": "Name", "email": "Email"}[f],
+            key=f"part_sort_{event_id}"
+        )
+        descending = st.checkbox("Descending", key=f"part_desc_{event_id}")
+        from_col, to_col = st.columns(2)
+        with from_col:
+            registered_from = st.date_input("Registered from", value=None, key=f"part_from_{event_id}")
+        with to_col:
+            registered_to = st.date_input("Registered until", value=None, key=f"part_to_{event_id}")
+        
+        # Clamp the page when a new filter leaves fewer pages than before
+        page_key = f"part_page_{event_id}"
+        page = st.session_state.get(page_key, 1)
+        filters = dict(registered_from=registered_from, registered_to=registered_to)
+        rows, total = query_participants(participants, search, sort_by, descending, page, **filters)
+        pages = max(1, -(-total // PAGE_SIZE))
+        if page > pages:
+            page = st.session_state[page_key] = pages
+            rows, total = query_participants(participants, search, sort_by, descending, page, **filters)
+        
+        st.dataframe(
+            pd.DataFrame(rows, columns=['name', 'email', 'phone', 'timestamp']),
+            hide_index=True,
+            use_container_width=True
+        )
+        st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=page_key)
+        st.caption(f"{total} matching participants")
+        
+        # The CSV is only generated when the button is clicked
+        st.download_button(
+            "⬇️ Export CSV",
+            data=lambda: participants_csv(participants),
+            file_name=f"participants_{event_id}.csv",
+            mime="text/csv",
+            key=f"part_csv_{event_id}"
+        )
 
 # Initialize data
-events = load_json(EVENTS_FILE)
-registrations = load_json(REGISTRATIONS_FILE)
-
-# Modified styling function
-def add_bg_from_local(image_file):
-    try:
-        with open(image_file, "rb") as f:
-            encoded_string = base64.b64encode(f.read()).decode()
-            return f"""
-            <style>
-            .stApp {{
-                background-color: #000000;
-                color: #FFFFFF;
-            }}
-            .main-title {{
-                text-align: center;
-                padding: 0;
-                margin: 0;
-            }}
-            .stApp > header {{
-                background-color: #000000;
-            }}
-            div.stForm {{
-                background-color: #1a1a1a;
-                padding: 20px;
-                border-radius: 5px;
-            }}
-            div.element-container:empty {{
-                padding: 0 !important;
-                margin: 0 !important;
-            }}
-            .stButton button {{
-                background-color: #333333;
-                color: white;
-                border: 1px solid #444444;
-            }}
-            .stTextInput input {{
-                background-color: #1a1a1a;
-                color: white;
-                border: 1px solid #333333;
-            }}
-            .stSelectbox select {{
-                background-color: #1a1a1a;
-                color: white;
-            }}
-            .sidebar-header {{
-                text-align: center;
-                padding: 20px 0;
-                border-bottom: 1px solid #333;
-                margin-bottom: 20px;
-            }}
-            
-            .sidebar-menu {{
-                display: flex;
-                flex-direction: column;
-                gap: 10px;
-                padding: 10px;
-            }}
-            
-            .sidebar-menu button {{
-                background-color: #1a1a1a;
-                color: white;
-                border: 1px solid #333;
-                padding: 10px;
-                border-radius: 5px;
-                width: 100%;
-                text-align: left;
-                transition: background-color 0.3s;
-            }}
-            
-            .sidebar-menu button:hover {{
-                background-color: #333;
-            }}
-            
-            .sidebar-menu button.active {{
-                background-color: #444;
-                border-color: #666;
-            }}
-            </style>
-            """
-    except FileNotFoundError:
-        return """
-        <style>
-        .stApp {
-            background-color: #000000;
-            color: #FFFFFF;
-        }
-        </style>
-        """
+@st.cache_resource
+def get_store():
+    """Load the data files once per process; later changes arrive through the change feed"""
+    return SharedStore({'events': EVENTS_FILE, 'registrations': REGISTRATIONS_FILE}, load_json, save_json)
+
+# Apply whatever other app processes changed since the last rerun
+try:
+    store = get_store()
+    store.refresh()
+except ValueError as e:
+    st.error(f"The data files can't be read, restore them from a backup: {str(e)}")
+    st.stop()
+# The store never changes these dicts in place, so this rerun sees one consistent version
+store_data = store.data
+events = store_data['events']
+registrations = store_data['registrations']
+
+@st.cache_resource
+def get_search_index():
+    """Build the event search index once per process; the store keeps it in sync"""
+    return store.watch('events', EventSearchIndex)
+
+search_index = get_search_index()
+
+@st.cache_resource
+def get_event_timeline():
+    """Build the date-ordered event index once per process; the store keeps it in sync"""
+    return store.watch('events', EventTimeline)
+
+event_timeline = get_event_timeline()
+
+@st.cache_resource
+def get_participant_index():
+    """Group registrations by event once per process; the store keeps it in sync"""
+    return store.watch('registrations', ParticipantIndex)
+
+participant_index = get_participant_index()
+
+@st.cache_resource
+def get_occupancy_cube():
+    """Aggregate occupancy by location and period once per process; the store keeps it in sync"""
+    cube = OccupancyCube()
+    store.watch('events', cube.watch_events)
+    store.watch('registrations', cube.watch_registrations)
+    return store.locked(cube)
+
+occupancy_cube = get_occupancy_cube()
+
+@st.cache_resource
+def get_geocoder():
+    """Start the background geocoder once per process; it picks up new events through the store"""
+    worker = GeocodingWorker(store)
+    return store.watch('events', worker.watch)
+
+geocoder = get_geocoder()
+
+@st.cache_resource
+def get_page_style():
+    """Build the stylesheet once per process"""
+    return page_style(st.get_option("server.enableStaticServing"))
 
 # Add authentication function
 def authenticate(username, password):
@@ -343,7 +358,7 @@ if 'authenticated' not in st.session_state:
 
 # Streamlit UI setup
 st.set_page_config(page_title="Event Management System", layout="centered")
-st.markdown(add_bg_from_local('wd.jpg'), unsafe_allow_html=True)
+st.markdown(get_page_style(), unsafe_allow_html=True)
 
 # Login Screen
 if not st.session_state.authenticated:
@@ -387,6 +402,27 @@ else:
                 st.rerun()
     st.sidebar.markdown('</div>', unsafe_allow_html=True)
     
+    if use_snapshots() and st.sidebar.button("💾 Export readable JSON", key="export_json", use_container_width=True):
+        if export_readable_json():
+            st.sidebar.success(f"Saved {EVENTS_FILE} and {REGISTRATIONS_FILE}")
+        else:
+            st.sidebar.error("Failed to export JSON")
+
+    # Background geocoding progress
+    geo_status = geocoder.status()
+    with st.sidebar.expander("🗺️ Map locations"):
+        st.write(f"Resolved: {geo_status['resolved']} · Not found: {geo_status['not_found']} · Errors: {geo_status['failed']}")
+        if geo_status['pending_locations']:
+            st.write(f"Resolving {geo_status['pending_locations']} location(s) for {geo_status['pending_events']} event(s)...")
+        if not geo_status['leader']:
+            st.caption("Lookups run in another app process, which also keeps the counts above")
+        if geo_status['failed_locations']:
+            st.warning(f"{geo_status['failed_locations']} location(s) could not be resolved")
+            for location, reason in list(geocoder.failures.items())[:10]:
+                st.caption(f"{location}: {reason}")
+            if st.button("Retry failed", key="geocode_retry"):
+                st.success(f"Retrying {geocoder.retry_failed()} location(s)")
+    
     # Use the active menu selection
     choice = st.session_state.active_menu
     
@@ -419,8 +455,9 @@ else:
                         "created_at": str(datetime.now())
                     }
                     
-                    events[event_id] = event_data
-                    if save_json(events, EVENTS_FILE):
+                    with store.transaction() as tx:
+                        tx.put('events', event_id, event_data)
+                    if tx.ok:
                         # Schedule reminder only if event save was successful
                         if schedule_reminder(event_id, event_data):
                             st.success(f"🎉 Event '{name}' has been created with reminder!")
@@ -436,11 +473,21 @@ else:
     elif choice == "View Events":
         st.header("Available Events")
         
+        search_query = st.text_input("🔍 Search events", placeholder="Name, description or location", key="view_search")
+        
         # Create two columns for events
         left_col, right_col = st.columns(2)
         
         # Split events into two lists for columns
-        event_items = list(events.items())
+        if search_query:
+            hits = search_index.search(search_query, limit=SEARCH_LIMIT)
+            event_items = [(eid, events[eid]) for eid in hits if eid in events]
+            if not event_items:
+                st.info("No events match your search")
+            elif len(hits) == SEARCH_LIMIT:
+                st.caption(f"Showing the {SEARCH_LIMIT} best matches, refine your search to see others")
+        else:
+            event_items = list(events.items())
         mid_point = len(event_items) // 2
         
         # Left column events
@@ -454,20 +501,19 @@ else:
                     # Add map for location
                     if event.get('location'):
                         try:
-                            map_obj = display_location_map(event['location'])
+                            map_obj = display_location_map(event)
                             if map_obj:
                                 st.write("📍 Location Map:")
                                 folium_static(map_obj, width=300, height=200)
                             else:
-                                st.warning(f"Could not load map for {event['location']}")
+                                st.info(f"Map for {event['location']} is not available yet")
                         except Exception as e:
                             st.error(f"Failed to display map: {str(e)}")
                     
                     st.write("⏰ Time:", event.get('time', 'TBD'))
                     st.write("👥 Capacity:", f"{event['registered']}/{event['capacity']}")
                     
-                    participants = get_event_participants(event_id)
-                    show_participants_modal(event['name'], participants)
+                    show_participants_modal(event_id, event['name'])
                     
                     # Add section divider for settings
                     st.markdown("---")
@@ -491,20 +537,19 @@ else:
                     # Add map for location
                     if event.get('location'):
                         try:
-                            map_obj = display_location_map(event['location'])
+                            map_obj = display_location_map(event)
                             if map_obj:
                                 st.write("📍 Location Map:")
                                 folium_static(map_obj, width=300, height=200)
                             else:
-                                st.warning(f"Could not load map for {event['location']}")
+                                st.info(f"Map for {event['location']} is not available yet")
                         except Exception as e:
                             st.error(f"Failed to display map: {str(e)}")
                     
                     st.write("⏰ Time:", event.get('time', 'TBD'))
                     st.write("👥 Capacity:", f"{event['registered']}/{event['capacity']}")
                     
-                    participants = get_event_participants(event_id)
-                    show_participants_modal(event['name'], participants)
+                    show_participants_modal(event_id, event['name'])
                     
                     # Add section divider for settings
                     st.markdown("---")
@@ -521,11 +566,29 @@ else:
     elif choice == "Register for Event":
         st.header("Register for Event")
         
-        # Filter out full events
-        available_events = {k: v for k, v in events.items() if v['registered'] < v['capacity']}
+        search_query = st.text_input("🔍 Search events", placeholder="Name, description or location", key="register_search")
+        
+        # Only look at upcoming events (narrowed to search hits when searching), then filter out full events
+        now = datetime.now()
+        def is_open(eid):
+            event = events.get(eid)
+            return event is not None and event['registered'] < event['capacity']
+        
+        if search_query:
+            # Filter inside the search, so past or full hits never crowd out open events
+            candidate_ids = search_index.search(
+                search_query, limit=SEARCH_LIMIT,
+                accept=lambda eid: (event_timeline.start_of(eid) or now) > now and is_open(eid),
+            )
+        else:
+            candidate_ids = [eid for eid in event_timeline.upcoming(now) if is_open(eid)]
+        available_events = {eid: events[eid] for eid in candidate_ids}
         
         if not available_events:
-            st.warning("No events available for registration")
+            if search_query:
+                st.warning("No open events match your search")
+            else:
+                st.warning("No events available for registration")
         else:
             event_options = {v['name']: k for k, v in available_events.items()}
             
@@ -573,17 +636,24 @@ else:
                         st.error("Name and email are required")
                     else:
                         reg_id = str(uuid.uuid4())
-                        registrations[reg_id] = {
-                            "event_id": event_id,
-                            "name": name,
-                            "email": email,
-                            "phone": phone,
-                            "timestamp": str(datetime.now())
-                        }
-                        event['registered'] += 1
+                        # Re-check under the store lock, another replica may have filled or deleted the event
+                        with store.transaction() as tx:
+                            current = store.data['events'].get(event_id)
+                            if current and current['registered'] < current['capacity']:
+                                tx.put('registrations', reg_id, {
+                                    "event_id": event_id,
+                                    "name": name,
+                                    "email": email,
+                                    "phone": phone,
+                                    "timestamp": str(datetime.now())
+                                })
+                                event = {**current, 'registered': current['registered'] + 1}
+                                tx.put('events', event_id, event)
                         
                         # Save registration and send email
-                        if save_json(events, EVENTS_FILE) and save_json(registrations, REGISTRATIONS_FILE):
+                        if not tx.changes:
+                            st.error("Sorry, this event is no longer open for registration")
+                        elif tx.ok:
                             if send_templated_email(
                                 REGISTRATION_TEMPLATE,
                                 email,
@@ -602,11 +672,46 @@ else:
     # Dashboard
     elif choice == "Event Dashboard":
         st.header("📊 Event Participation Dashboard")
-        for event_id, event in events.items():
-            st.subheader(event['name'])
-            st.write("📅 Date:", event['date'])
-            st.write("👥 Registered:", event['registered'], "/", event['capacity'])
-            st.progress(event['registered'] / event['capacity'])
+        now = datetime.now()
+        
+        st.subheader("🗓️ Next 7 Days")
+        week_ids = [eid for eid in event_timeline.upcoming(now, days=7) if eid in events]
+        if week_ids:
+            for event_id in week_ids:
+                event = events[event_id]
+                st.write(f"**{event['name']}** — {event_timeline.start_of(event_id):%a, %b %d at %I:%M %p} 📍 {event.get('location', 'TBD')}")
+        else:
+            st.info("No events in the next 7 days")
+        
+        st.subheader("📆 Calendar")
+        month_start = st.date_input("Month", value=now.date().replace(day=1), key="calendar_month")
+        month_events = event_timeline.month(month_start.year, month_start.month)
+        calendar_rows = ["| Mon | Tue | Wed | Thu | Fri | Sat | Sun |", "|---|---|---|---|---|---|---|"]
+        for week in calendar.monthcalendar(month_start.year, month_start.month):
+            cells = []
+            for day in week:
+                names = [events[eid]['name'] for eid in month_events.get(day, []) if eid in events]
+                cells.append("" if day == 0 else "<br>".join([f"**{day}**"] + names))
+            calendar_rows.append("| " + " | ".join(cells) + " |")
+        st.markdown("\n".join(calendar_rows), unsafe_allow_html=True)
+        
+        st.markdown("---")
+        groups = [("Upcoming", event_timeline.upcoming(now)), ("Past", event_timeline.past(now))]
+        # Events with an unreadable date still belong on the dashboard
+        undated_ids = event_timeline.undated()
+        if undated_ids:
+            groups.append(("Undated", undated_ids))
+        tabs = st.tabs([label for label, _ in groups])
+        for tab, (_, event_ids) in zip(tabs, groups):
+            with tab:
+                for event_id in event_ids:
+                    if event_id not in events:
+                        continue
+                    event = events[event_id]
+                    st.subheader(event['name'])
+                    st.write("📅 Date:", event.get('date') or 'TBD')
+                    st.write("👥 Registered:", event['registered'], "/", event['capacity'])
+                    st.progress(event['registered'] / event['capacity'])
 
     elif choice == "Analytics":
         st.header("📈 Event Analytics Dashboard")
@@ -667,6 +772,59 @@ else:
                     title='Event Capacity Distribution'
                 )
                 st.plotly_chart(fig_util, use_container_width=True)
+
+            # Occupancy drill-down, answered from the precomputed cube
+            st.subheader("Occupancy by Location")
+            level = st.radio("Group by", LEVELS, index=2, horizontal=True,
+                             format_func=str.capitalize, key="occupancy_level")
+            rollup = occupancy_cube.rollup(level)
+            if rollup.empty:
+                st.info("No dated events to analyze")
+            else:
+                fig_fill = px.bar(
+                    rollup,
+                    x=level,
+                    y='fill_rate',
+                    color='location',
+                    barmode='group',
+                    hover_data=['events', 'registered', 'capacity'],
+                    title=f'Fill Rate per Location by {level.capitalize()}',
+                    labels={'fill_rate': 'Fill Rate (%)', level: level.capitalize(), 'location': 'Location'}
+                )
+                st.plotly_chart(fig_fill, use_container_width=True)
+
+                drill1, drill2 = st.columns(2)
+                with drill1:
+                    location = st.selectbox("Location", ["All locations"] + occupancy_cube.locations(),
+                                            key="occupancy_location")
+                location = None if location == "All locations" else location
+                periods = rollup[level] if location is None else rollup.loc[rollup['location'] == location, level]
+                periods = sorted(periods.unique(), reverse=True)
+                with drill2:
+                    period = st.selectbox("Period", periods, format_func=lambda p: p.strftime('%b %d, %Y'),
+                                          key="occupancy_period")
+
+                col3, col4 = st.columns(2)
+                with col3:
+                    period_events = occupancy_cube.events_in(level, period, location)
+                    fig_events = px.bar(
+                        period_events,
+                        x='name',
+                        y=['registered', 'capacity'],
+                        barmode='group',
+                        title='Events in Selected Period',
+                        labels={'value': 'Participants', 'name': 'Event Name', 'variable': ''}
+                    )
+                    st.plotly_chart(fig_events, use_container_width=True)
+                with col4:
+                    fig_lead = px.bar(
+                        occupancy_cube.lead_times(location, level, period),
+                        x='lead_time',
+                        y='registrations',
+                        title='How Far Ahead People Register',
+                        labels={'lead_time': 'Registered Before Event', 'registrations': 'Registrations'}
+                    )
+                    st.plotly_chart(fig_lead, use_container_width=True)
             
             if registrations:
                 # Registration Timeline
@@ -0,0 +1,86 @@
+"""Compare save/load cost of the store serialization options.
+
+Usage: python benchmarks/bench_serialization.py [sizes...] > bench_output.txt
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization  # noqa: E402
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+REPEATS = 3
+
+
+def make_events(count):
+    """Build a store shaped like events.json, including mixed-language text and emoji."""
+    return {
+        str(uuid.uuid4()): {
+            "name": f"SK Basketball Tournament {i}",
+            "desc": "🏀 Get ready for action! Sali na sa liga ng kabataan — sign up today! #GameOn",
+            "date": "2025-05-23",
+            "time": "08:00:00",
+            "location": "San Juan, Surigao City, Surigao del Norte",
+            "capacity": 50,
+            "registered": i % 50,
+            "created_at": "2025-05-23 11:53:07.166677",
+        }
+        for i in range(count)
+    }
+
+
+def best_of(func):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def stdlib_save(data, path):
+    # What save_json did before the serialization layer
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=4)
+
+
+def stdlib_load(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def main(sizes):
+    codec = "orjson" if serialization.orjson is not None else "json (orjson not installed)"
+    print(f"JSON codec: {codec}")
+    print(f"{'events':>8}  {'format':<24} {'save ms':>9} {'load ms':>9} {'size KB':>9}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            data = make_events(size)
+            path = os.path.join(tmp, 'events.json')
+            rows = [
+                ("stdlib json, indent=4", lambda: stdlib_save(data, path), lambda: stdlib_load(path), path),
+                ("export_json (pretty)", lambda: serialization.export_json(data, path),
+                 lambda: serialization.load_store(path), path),
+            ]
+            if serialization.msgpack is not None:
+                rows.append(("msgpack snapshot", lambda: serialization.write_snapshot(data, path),
+                             lambda: serialization.read_snapshot(path), serialization.snapshot_path(path)))
+
+            for label, save, load, written in rows:
+                save_time = best_of(save)
+                load_time = best_of(load)
+                size_kb = os.path.getsize(written) / 1024
+                print(f"{size:>8}  {label:<24} {save_time * 1000:>9.1f} {load_time * 1000:>9.1f} {size_kb:>9.0f}")
+                # Leave only the JSON file behind so load_store picks the intended format next time
+                if written != path:
+                    os.remove(written)
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
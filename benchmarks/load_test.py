@@ -0,0 +1,414 @@
+"""Simulate concurrent users against a locally started app.py server.
+
+The harness copies the app into a scratch directory seeded with
+synthetic upcoming events and starts `streamlit run app.py` there in a
+subprocess, with geocoding and SMTP replaced by local stand-ins. Each simulated user then
+talks to the server over its websocket, the way a browser does: log in,
+open View Events, open Register for Event, pick an event and submit the
+registration form. The report covers rerun latency percentiles,
+throughput, error rate and whether the event counters on disk agree
+with the registration records.
+
+Usage: python benchmarks/load_test.py --sessions 20 --iterations 3
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Copied next to the modules, so the server reads .streamlit/config.toml
+# and publishes static/ in the scratch directory instead of the checkout
+APP_FOLDERS = ['assets', '.streamlit']
+EMAIL_LOG = 'emails.log'
+# Alerts that mean every seat was taken, which is an outcome rather than an error
+SOLD_OUT_MESSAGES = ("no longer open", "No events available")
+ADMIN_USERNAME = "admin"
+ADMIN_PASSWORD = "admin123"
+
+
+# --- Server side --- #
+class FakeGeocoderResponse:
+    def __init__(self, latency):
+        time.sleep(latency)
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return [{'lat': '9.7843', 'lon': '125.4888'}]
+
+
+class FakeSMTP:
+    """Accepts every message after a fixed delay and logs the recipient."""
+
+    latency = 0.0
+    lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def send_message(self, message):
+        time.sleep(self.latency)
+        with FakeSMTP.lock, open(EMAIL_LOG, 'a') as f:
+            f.write(f"{message['To']}\n")
+
+
+def serve(port, geocode_latency, smtp_latency):
+    """Run the app with stand-ins patched in. Runs in the server subprocess."""
+    from streamlit.web import cli
+
+    FakeSMTP.latency = smtp_latency
+    with mock.patch('requests.get', side_effect=lambda *a, **kw: FakeGeocoderResponse(geocode_latency)), \
+            mock.patch('smtplib.SMTP', FakeSMTP):
+        cli.main([
+            'run', 'app.py',
+            '--server.headless', 'true',
+            '--server.port', str(port),
+            '--server.address', '127.0.0.1',
+            '--server.enableXsrfProtection', 'false',
+            '--server.fileWatcherType', 'none',
+            '--browser.gatherUsageStats', 'false',
+            '--logger.level', 'error',
+        ], standalone_mode=False)
+
+
+def copy_app(directory):
+    """Copy the app's modules, stylesheet and Streamlit config into directory."""
+    for module in glob.glob(os.path.join(REPO_DIR, '*.py')):
+        shutil.copy(module, directory)
+    for folder in APP_FOLDERS:
+        shutil.copytree(os.path.join(REPO_DIR, folder), os.path.join(directory, folder))
+
+
+def seed_data(directory, event_count, capacity):
+    """Write events starting next week and no registrations."""
+    start = datetime.now() + timedelta(days=7)
+    events = {}
+    for i in range(event_count):
+        events[str(uuid.uuid4())] = {
+            "name": f"Load Test Event {i}",
+            "desc": "Synthetic event for load testing",
+            "date": (start + timedelta(days=i % 30)).date().isoformat(),
+            "time": "09:00:00",
+            "location": f"Barangay {i % 10}, Surigao City",
+            "capacity": capacity,
+            "registered": 0,
+            "created_at": str(datetime.now()),
+        }
+    with open(os.path.join(directory, 'events.json'), 'w') as f:
+        json.dump(events, f)
+    with open(os.path.join(directory, 'registrations.json'), 'w') as f:
+        json.dump({}, f)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_healthy(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("App server exited during startup")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("App server did not become healthy in time")
+
+
+# --- Client side --- #
+class SimulatedUser:
+    """Minimal Streamlit browser: sends reruns with widget states, collects the rendered elements."""
+
+    def __init__(self, url, timeout):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        self._BackMsg = BackMsg
+        self._ForwardMsg = ForwardMsg
+        self.url = url
+        self.timeout = timeout
+        self.websocket = None
+        self.values = {}
+        self.elements = []
+        self.latencies = []
+
+    async def connect(self):
+        import websockets
+
+        self.websocket = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None)
+
+    async def close(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+
+    async def rerun(self, triggers=()):
+        """Rerun the script with the current widget values plus any clicked buttons."""
+        msg = self._BackMsg()
+        client_state = msg.rerun_script
+        # An empty rerun_script still has to be present in the message
+        client_state.SetInParent()
+        for state in self.values.values():
+            client_state.widget_states.widgets.add().CopyFrom(state)
+        for widget_id in triggers:
+            state = client_state.widget_states.widgets.add()
+            state.id = widget_id
+            state.trigger_value = True
+
+        start = time.perf_counter()
+        await self.websocket.send(msg.SerializeToString())
+        await asyncio.wait_for(self._read_run(), self.timeout)
+        self.latencies.append(time.perf_counter() - start)
+
+    async def _read_run(self):
+        finished = self._ForwardMsg.ScriptFinishedStatus
+        while True:
+            fwd = self._ForwardMsg()
+            fwd.ParseFromString(await self.websocket.recv())
+            kind = fwd.WhichOneof('type')
+            if kind == 'new_session':
+                # Every script run, including st.rerun(), starts with a new_session message
+                self.elements = []
+            elif kind == 'delta' and fwd.delta.WhichOneof('type') == 'new_element':
+                element = fwd.delta.new_element
+                self.elements.append((element.WhichOneof('type'), element))
+            elif kind == 'script_finished':
+                if fwd.script_finished == finished.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("script failed to compile")
+                if fwd.script_finished != finished.FINISHED_EARLY_FOR_RERUN:
+                    return
+
+    def find(self, kind, label_part):
+        """Return the first rendered widget of a kind whose label contains label_part."""
+        for element_kind, element in self.elements:
+            if element_kind == kind:
+                widget = getattr(element, kind)
+                if label_part in widget.label:
+                    return widget
+        raise LookupError(f"No {kind} labelled like {label_part!r}")
+
+    def set_string(self, widget, value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        self.values[widget.id] = WidgetState(id=widget.id, string_value=value)
+
+    def alerts(self):
+        return [(element.alert.format, element.alert.body) for kind, element in self.elements if kind == 'alert']
+
+    def sold_out(self):
+        return any(message in body for _, body in self.alerts() for message in SOLD_OUT_MESSAGES)
+
+    def exceptions(self):
+        return [element.exception.message for kind, element in self.elements if kind == 'exception']
+
+
+class UserResult:
+    def __init__(self):
+        self.latencies = []
+        self.errors = []
+        self.registrations = 0
+        self.sold_out = 0
+
+
+async def run_user(url, user_id, iterations, timeout):
+    from streamlit.proto.Alert_pb2 import Alert
+
+    result = UserResult()
+    rng = random.Random(user_id)
+    user = SimulatedUser(url, timeout)
+    try:
+        await user.connect()
+        await user.rerun()
+
+        user.set_string(user.find('text_input', "Username"), ADMIN_USERNAME)
+        user.set_string(user.find('text_input', "Password"), ADMIN_PASSWORD)
+        await user.rerun([user.find('button', "Login").id])
+        user.values.clear()
+
+        for iteration in range(iterations):
+            try:
+                await user.rerun([user.find('button', "View Events").id])
+                await user.rerun([user.find('button', "Register for Event").id])
+                if user.sold_out():
+                    result.sold_out += 1
+                    continue
+
+                select = user.find('selectbox', "Choose Event")
+                user.set_string(select, rng.choice(list(select.options)))
+                await user.rerun()
+                if user.sold_out():
+                    result.sold_out += 1
+                    continue
+
+                user.set_string(user.find('text_input', "your name"), f"Load Tester {user_id}-{iteration}")
+                user.set_string(user.find('text_input', "(email)"), f"tester{user_id}.{iteration}@example.com")
+                await user.rerun([user.find('button', "Count me in").id])
+
+                errors = user.exceptions()
+                alerts = user.alerts()
+                if errors:
+                    result.errors.append(f"register: {errors[0]}")
+                elif any(fmt == Alert.SUCCESS or body.startswith("Registered successfully") for fmt, body in alerts):
+                    result.registrations += 1
+                elif user.sold_out():
+                    # Losing a race for the last seat is expected
+                    result.sold_out += 1
+                else:
+                    result.errors.append(f"register: {[body for _, body in alerts] or 'no confirmation shown'}")
+            except (LookupError, asyncio.TimeoutError) as e:
+                result.errors.append(f"iteration {iteration}: {e!r}")
+            finally:
+                # Drop form values so the next iteration starts from a clean page
+                user.values.clear()
+    except Exception as e:
+        result.errors.append(f"user {user_id} aborted: {e!r}")
+    finally:
+        result.latencies = user.latencies
+        await user.close()
+    return result
+
+
+async def run_users(url, sessions, iterations, timeout):
+    return await asyncio.gather(*(run_user(url, i, iterations, timeout) for i in range(sessions)))
+
+
+# --- Reporting --- #
+def check_consistency(directory):
+    """Compare each event's registered counter with its registration records."""
+    sys.path.insert(0, REPO_DIR)
+    from serialization import load_store
+
+    events = load_store(os.path.join(directory, 'events.json'))
+    registrations = load_store(os.path.join(directory, 'registrations.json'))
+
+    counted = {}
+    for reg in registrations.values():
+        counted[reg['event_id']] = counted.get(reg['event_id'], 0) + 1
+    mismatches = [
+        (event['name'], event['registered'], counted.get(event_id, 0))
+        for event_id, event in events.items()
+        if event['registered'] != counted.get(event_id, 0)
+    ]
+    overfilled = [event['name'] for event in events.values() if event['registered'] > event['capacity']]
+    orphans = sum(1 for reg in registrations.values() if reg['event_id'] not in events)
+    return len(registrations), mismatches, overfilled, orphans
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def report(results, elapsed, directory):
+    latencies = sorted(l for r in results for l in r.latencies)
+    errors = [e for r in results for e in r.errors]
+    registered = sum(r.registrations for r in results)
+    sold_out = sum(r.sold_out for r in results)
+    reruns = len(latencies)
+
+    print(f"Sessions: {len(results)}  Reruns: {reruns}  Wall time: {elapsed:.1f}s")
+    print(f"Throughput: {reruns / elapsed:.1f} reruns/s, {registered / elapsed:.1f} registrations/s")
+    if latencies:
+        print("Rerun latency (ms): " + "  ".join(
+            f"p{p}={percentile(latencies, p) * 1000:.0f}" for p in (50, 90, 95, 99)
+        ) + f"  max={latencies[-1] * 1000:.0f}  mean={statistics.mean(latencies) * 1000:.0f}")
+    print(f"Registrations turned away because events were full: {sold_out}")
+    print(f"Errors: {len(errors)} ({len(errors) / max(reruns + len(errors), 1) * 100:.1f}%)")
+    for error in errors[:10]:
+        print(f"  - {error}")
+
+    try:
+        with open(os.path.join(directory, EMAIL_LOG)) as f:
+            emails = sum(1 for _ in f)
+    except FileNotFoundError:
+        emails = 0
+    total, mismatches, overfilled, orphans = check_consistency(directory)
+    print(f"Confirmation emails sent: {emails}")
+    print(f"Registrations confirmed to users: {registered}, records on disk: {total}")
+    print(f"Counter mismatches: {len(mismatches)}  Overfilled events: {len(overfilled)}  Orphan registrations: {orphans}")
+    for name, registered_count, records in mismatches[:10]:
+        print(f"  - {name}: registered={registered_count} records={records}")
+    return not errors and not mismatches and not overfilled and not orphans and registered == total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=10, help="concurrent simulated users")
+    parser.add_argument('--iterations', type=int, default=3, help="registrations attempted per user")
+    parser.add_argument('--events', type=int, default=20, help="events to seed")
+    parser.add_argument('--capacity', type=int, default=1000, help="capacity of each seeded event")
+    parser.add_argument('--geocode-latency', type=float, default=0.05, help="seconds per fake geocoding call")
+    parser.add_argument('--smtp-latency', type=float, default=0.1, help="seconds per fake email")
+    parser.add_argument('--timeout', type=float, default=120, help="seconds before a rerun counts as failed")
+    parser.add_argument('--keep', action='store_true', help="keep the scratch data directory")
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.geocode_latency, args.smtp_latency)
+        return
+
+    directory = tempfile.mkdtemp(prefix='loadtest-')
+    copy_app(directory)
+    seed_data(directory, args.events, args.capacity)
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', str(port),
+         '--geocode-latency', str(args.geocode_latency), '--smtp-latency', str(args.smtp_latency)],
+        cwd=directory,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_healthy(port, server)
+        start = time.perf_counter()
+        results = asyncio.run(run_users(f"ws://127.0.0.1:{port}/_stcore/stream",
+                                        args.sessions, args.iterations, args.timeout))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    ok = report(results, elapsed, directory)
+    if args.keep:
+        print(f"Data kept in {directory}")
+    else:
+        shutil.rmtree(directory, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# --- Constants --- #
+JOURNAL_FILE = 'store_journal.log'
+LOCK_FILE = 'store.lock'
+# Once the journal grows past this it is truncated right after a save
+MAX_JOURNAL_BYTES = 1024 * 1024
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock shared by every process using the same lock file."""
+    with open(path, 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def try_lock_file(path):
+    """Take an exclusive lock on path without waiting.
+
+    Returns the open lock file, which holds the lock until it is closed or
+    the process exits, or None if another process holds it.
+    """
+    f = open(path, 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+class ChangeFeed:
+    """Versioned, append-only journal of store changes.
+
+    Every line is a JSON object ``{"v": version, "store": name, "key": key,
+    "value": value}`` where a null value means the key was deleted.
+    Versions increase by one per line, so a reader that finds a gap, a
+    torn line or a shorter file knows it fell behind a compaction and has
+    to reload the snapshots instead.
+    """
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.offset = 0
+        self.version = 0
+
+    def _size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def seek_to_end(self):
+        """Skip everything already journaled. Call with the lock held, right after loading the snapshots."""
+        self.offset = 0
+        self.version = 0
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        self.version = json.loads(line)['v']
+                    except (ValueError, KeyError):
+                        pass
+                    self.offset += len(line)
+        except FileNotFoundError:
+            pass
+
+    def poll(self):
+        """Return changes published since the last call, or None if a full reload is needed."""
+        size = self._size()
+        if size == self.offset:
+            return []
+        if size < self.offset:
+            return None
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+
+        changes = []
+        # The last piece is empty, or a line that is still being written
+        for line in data.split(b"\n")[:-1]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                return None
+            if entry.get('v') != self.version + 1 or 'store' not in entry:
+                return None
+            self.version = entry['v']
+            self.offset += len(line) + 1
+            changes.append((entry['store'], entry['key'], entry['value']))
+        return changes
+
+    def publish(self, changes):
+        """Append changes. Call with the lock held, right after a poll."""
+        lines = []
+        for name, key, value in changes:
+            self.version += 1
+            lines.append(json.dumps({'v': self.version, 'store': name, 'key': key, 'value': value}))
+        data = ("\n".join(lines) + "\n").encode('utf-8')
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.offset += len(data)
+
+    def compact(self):
+        """Truncate the journal once it is large. Call with the lock held, right after saving the snapshots."""
+        if self.offset < MAX_JOURNAL_BYTES:
+            return
+        # Keep the current version so later entries stay numbered after it
+        data = (json.dumps({'v': self.version, 'compacted': True}) + "\n").encode('utf-8')
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        self.offset = len(data)
+
+
+class StoreTransaction:
+    """Changes staged inside SharedStore.transaction(), applied when it exits."""
+
+    def __init__(self):
+        self.changes = []
+        self.ok = False
+
+    def put(self, name, key, value):
+        self.changes.append((name, key, value))
+
+    def delete(self, name, key):
+        self.changes.append((name, key, None))
+
+
+class LockedIndex:
+    """Proxy that runs every method of an index under the store's index lock.
+
+    Sessions query indexes from their own script threads while
+    transactions update them, so queries never see a half-applied change.
+    """
+
+    def __init__(self, index, lock):
+        self._index = index
+        self._lock = lock
+
+    def __getattr__(self, name):
+        attr = getattr(self._index, name)
+        if not callable(attr):
+            return attr
+        def locked(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return locked
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index)
+
+    def __contains__(self, item):
+        with self._lock:
+            return item in self._index
+
+
+class SharedStore:
+    """JSON stores shared by several app processes.
+
+    Each process loads the snapshot files once and then follows the
+    change feed, applying only the entries other processes published.
+    Writes go through transaction(), which takes an inter-process lock,
+    catches up on the feed, saves the snapshots and publishes the delta,
+    so replicas no longer overwrite each other's changes. Indexes
+    registered with watch() are kept in sync with every change.
+
+    The store dicts are copy-on-write: a change builds new dicts and
+    swaps them into ``data``, so a dict handed out is never modified.
+    Read ``store.data`` once per rerun and keep using those dicts.
+    """
+
+    def __init__(self, paths, load, save, journal_path=JOURNAL_FILE, lock_path=LOCK_FILE):
+        self.paths = paths
+        self._load = load
+        self._save = save
+        self.lock_path = lock_path
+        self.feed = ChangeFeed(journal_path)
+        self.data = {name: {} for name in paths}
+        self._mutex = threading.RLock()
+        self._index_lock = threading.RLock()
+        self._indexes = []
+        with file_lock(self.lock_path):
+            self._reload()
+
+    def locked(self, index):
+        """Wrap an object so its methods run under the index lock."""
+        return LockedIndex(index, self._index_lock)
+
+    def watch(self, name, index_factory):
+        """Build an index over one store and keep it updated. Returns the index behind a LockedIndex."""
+        with self._mutex, self._index_lock:
+            index = index_factory(self.data[name])
+            self._indexes.append((name, index))
+            return self.locked(index)
+
+    def refresh(self):
+        """Apply changes other processes published since the last call."""
+        with self._mutex:
+            if not self._catch_up():
+                with file_lock(self.lock_path):
+                    self._reload()
+
+    @contextmanager
+    def transaction(self):
+        """Stage changes with put()/delete(); they are saved and published on exit.
+
+        Reads inside the block must go through ``store.data``, which then
+        holds every replica's latest data. Staged changes only become
+        visible once the block exits, and ``tx.ok`` tells whether they
+        were saved.
+        """
+        with self._mutex, file_lock(self.lock_path):
+            if not self._catch_up():
+                self._reload()
+            tx = StoreTransaction()
+            yield tx
+            if not tx.changes:
+                tx.ok = True
+                return
+
+            # Save the new versions first; memory only changes once they are on disk
+            updated = self._updated(tx.changes)
+            if all(self._save(store, self.paths[name]) for name, store in updated.items()):
+                self.feed.publish(tx.changes)
+                self.feed.compact()
+                self._swap(updated, tx.changes)
+                tx.ok = True
+
+    def _catch_up(self):
+        """Apply pending feed entries. Returns False if the snapshots must be reloaded instead."""
+        changes = self.feed.poll()
+        if changes is None:
+            logging.info("Fell behind the change feed, reloading stores")
+            return False
+        changes = [change for change in changes if change[0] in self.data]
+        if changes:
+            self._swap(self._updated(changes), changes)
+        return True
+
+    def _reload(self):
+        """Reload every snapshot and rebuild the indexes. Call with the lock held."""
+        old = self.data
+        self.data = {name: self._load(path) for name, path in self.paths.items()}
+        with self._index_lock:
+            for name in self.paths:
+                for key in old[name]:
+                    self._notify(name, key, None)
+                for key, value in self.data[name].items():
+                    self._notify(name, key, value)
+        self.feed.seek_to_end()
+
+    def _updated(self, changes):
+        """Return new copies of the stores touched by changes, with the changes applied."""
+        updated = {}
+        for name, key, value in changes:
+            if name not in updated:
+                updated[name] = dict(self.data[name])
+            if value is None:
+                updated[name].pop(key, None)
+            else:
+                updated[name][key] = value
+        return updated
+
+    def _swap(self, updated, changes):
+        with self._index_lock:
+            self.data = {**self.data, **updated}
+            for name, key, value in changes:
+                self._notify(name, key, value)
+
+    def _notify(self, name, key, value):
+        for index_name, index in self._indexes:
+            if index_name != name:
+                continue
+            if value is None:
+                index.remove(key)
+            else:
+                index.add(key, value)
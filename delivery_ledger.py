@@ -0,0 +1,87 @@
+import logging
+import os
+import threading
+from datetime import datetime
+
+# --- Constants --- #
+LEDGER_FILE = 'reminder_ledger.log'
+
+
+class DeliveryLedger:
+    """Append-only record of reminder emails that were actually sent.
+
+    Each delivery is one tab-separated line:
+    ``event_id  kind  registration_id  sent_at``. The keys are loaded into
+    an in-memory set on startup, so checking whether a recipient was
+    already mailed is a hash lookup and a restart can pick up a fan-out
+    where it stopped without sending anything twice.
+    """
+
+    def __init__(self, path=LEDGER_FILE):
+        self.path = path
+        self._sent = set()
+        self._lock = threading.Lock()
+        for event_id, kind, registration_id, _ in self.entries():
+            self._sent.add((event_id, kind, registration_id))
+        self._torn_tail = self._has_torn_tail()
+
+    def __len__(self):
+        return len(self._sent)
+
+    def has(self, event_id, kind, registration_id):
+        """Return True if this reminder already reached this registration."""
+        return (event_id, kind, registration_id) in self._sent
+
+    def record(self, event_id, kind, registration_id):
+        """Append a delivery to the ledger. Recording twice is a no-op."""
+        key = (event_id, kind, registration_id)
+        with self._lock:
+            if key in self._sent:
+                return
+            line = "\t".join(key + (datetime.now().isoformat(timespec='seconds'),)) + "\n"
+            if self._torn_tail:
+                # Terminate a partial line left by a crash so this entry stays intact
+                line = "\n" + line
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                logging.error(f"Failed to record reminder delivery: {str(e)}")
+                return
+            self._sent.add(key)
+            self._torn_tail = False
+
+    def count_sent_on(self, day):
+        """Number of deliveries recorded on the given date."""
+        prefix = day.isoformat()
+        return sum(1 for *_, sent_at in self.entries() if sent_at.startswith(prefix))
+
+    def entries(self, event_id=None):
+        """Yield ``(event_id, kind, registration_id, sent_at)`` from the ledger file."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    # A crash mid-write can leave a partial last line, skip it
+                    if not line.endswith("\n"):
+                        continue
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) != 4:
+                        continue
+                    if event_id is None or fields[0] == event_id:
+                        yield tuple(fields)
+        except FileNotFoundError:
+            return
+
+    def _has_torn_tail(self):
+        """Return True if the ledger file doesn't end with a newline."""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return False
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b"\n"
+        except FileNotFoundError:
+            return False
@@ -0,0 +1,99 @@
+import bisect
+import calendar
+from datetime import datetime, timedelta
+
+
+# --- Parsing --- #
+def parse_event_start(event):
+    """Return when an event starts, or None if its date can't be parsed."""
+    date_str = event.get('date')
+    time_str = event.get('time') or '00:00:00'
+    try:
+        return datetime.fromisoformat(f"{date_str}T{time_str}")
+    except (TypeError, ValueError):
+        pass
+    # Fall back to midnight when only the time is unusable
+    try:
+        return datetime.fromisoformat(str(date_str))
+    except (TypeError, ValueError):
+        return None
+
+
+# --- Index --- #
+class EventTimeline:
+    """Events kept sorted by start datetime for range queries.
+
+    Entries are ``(start, event_id)`` tuples in a sorted list, so every
+    query is a pair of bisects plus a slice instead of a scan over all
+    events. Events without a parsable date are kept apart and listed by
+    undated().
+    """
+
+    def __init__(self, events=None):
+        self._entries = []
+        self._starts = {}
+        self._undated = {}
+        for event_id, event in (events or {}).items():
+            self.add(event_id, event)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, event_id):
+        return event_id in self._starts
+
+    def add(self, event_id, event):
+        """Insert or move an event according to its start datetime."""
+        self.remove(event_id)
+        start = parse_event_start(event)
+        if start is None:
+            self._undated[event_id] = None
+            return
+        bisect.insort(self._entries, (start, event_id))
+        self._starts[event_id] = start
+
+    def remove(self, event_id):
+        """Drop an event from the timeline. Unknown ids are ignored."""
+        self._undated.pop(event_id, None)
+        start = self._starts.pop(event_id, None)
+        if start is not None:
+            del self._entries[bisect.bisect_left(self._entries, (start, event_id))]
+
+    def start_of(self, event_id):
+        """Return the parsed start of an indexed event, or None."""
+        return self._starts.get(event_id)
+
+    def undated(self):
+        """Return ids of events whose date can't be parsed, in the order they were added."""
+        return list(self._undated)
+
+    def between(self, start, end):
+        """Return ids of events starting in [start, end), earliest first."""
+        lo = bisect.bisect_left(self._entries, (start,))
+        hi = bisect.bisect_left(self._entries, (end,))
+        return [event_id for _, event_id in self._entries[lo:hi]]
+
+    def upcoming(self, now=None, days=None):
+        """Return ids of events starting from now on, optionally within days."""
+        now = now or datetime.now()
+        lo = bisect.bisect_left(self._entries, (now,))
+        if days is None:
+            hi = len(self._entries)
+        else:
+            hi = bisect.bisect_left(self._entries, (now + timedelta(days=days),))
+        return [event_id for _, event_id in self._entries[lo:hi]]
+
+    def past(self, now=None):
+        """Return ids of events that already started, most recent first."""
+        now = now or datetime.now()
+        hi = bisect.bisect_left(self._entries, (now,))
+        return [event_id for _, event_id in reversed(self._entries[:hi])]
+
+    def month(self, year, month):
+        """Return ``{day: [event_id, ...]}`` for the days of a month with events."""
+        first = datetime(year, month, 1)
+        last = first + timedelta(days=calendar.monthrange(year, month)[1])
+        days = {}
+        for event_id in self.between(first, last):
+            days.setdefault(self._starts[event_id].day, []).append(event_id)
+        return days
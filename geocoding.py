@@ -0,0 +1,264 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from change_feed import try_lock_file
+from reminder_dispatcher import TokenBucket
+
+# --- Constants --- #
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+# Nominatim's usage policy: at most one request per second and an identifying User-Agent
+RATE_PER_SECOND = 1.0
+USER_AGENT = "ProjTanny event scheduler"
+REQUEST_TIMEOUT = 10
+WORKERS = 4
+# Only the app process holding this lock looks locations up, so the rate
+# limit holds across replicas and no place is looked up twice
+LOCK_FILE = 'geocoder.lock'
+# How often the other processes check whether the lookup process is gone
+CLAIM_INTERVAL = 10  # seconds
+# Resolved locations are saved together in one transaction this often, so
+# a bulk import doesn't rewrite the events store once per location
+SAVE_INTERVAL = 5  # seconds
+
+
+def location_key(location):
+    """Normalize a location so the same place typed twice is geocoded once."""
+    return " ".join(location.split()).casefold()
+
+
+def event_coordinates(event):
+    """Return ``(lat, lon)`` resolved for the event's current location, or None."""
+    geo = event.get('geo')
+    if geo and geo.get('query') == event.get('location'):
+        return geo['lat'], geo['lon']
+    return None
+
+
+def get_location_coordinates(location):
+    """Get coordinates for a location using OpenStreetMap Nominatim API.
+
+    Returns None if nothing matches; network and HTTP errors are raised.
+    """
+    response = requests.get(
+        NOMINATIM_URL,
+        params={'q': location, 'format': 'json', 'limit': 1},
+        headers={'User-Agent': USER_AGENT},
+        timeout=REQUEST_TIMEOUT,
+    )
+    response.raise_for_status()
+    data = response.json()
+    if data:
+        return float(data[0]['lat']), float(data[0]['lon'])
+    return None
+
+
+class GeocodingWorker:
+    """Resolves event locations in the background and saves them on the events.
+
+    Register it with ``store.watch('events', worker.watch)``: every event
+    whose location has no coordinates yet, at startup or whenever one is
+    created or imported, is queued under its normalized location, so each
+    distinct place is looked up once however many events share it.
+    Lookups run on a thread pool behind a shared rate limit, and results
+    are written back as ``event['geo']`` in one store transaction every
+    SAVE_INTERVAL seconds, which
+    other replicas pick up through the change feed. Only the process
+    holding ``lock_file`` runs lookups; the others keep track of what is
+    waiting and take over if that process goes away.
+    """
+
+    def __init__(self, store, geocode=get_location_coordinates, rate=RATE_PER_SECOND, workers=WORKERS,
+                 lock_file=LOCK_FILE):
+        self.store = store
+        self.geocode = geocode
+        self.bucket = TokenBucket(rate, 1)
+        self.lock_file = lock_file
+        self.stats = {"resolved": 0, "not_found": 0, "failed": 0}
+        self.failures = {}  # location key -> why its last lookup or save failed
+
+        self._lock = threading.Lock()
+        self._bucket_lock = threading.Lock()
+        self._waiting = {}  # location key -> {event_id: location}
+        self._key_of = {}  # event_id -> location key
+        self._resolved = {}  # location key -> (lat, lon), so later events reuse the lookup
+        self._queued = set()
+        self._leader = None  # open lock file while this process runs lookups
+        self._next_claim = 0
+        self._unsaved = {}  # location key -> location, resolved but not saved yet
+        self._saver = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geocoder")
+
+    def watch(self, events):
+        for event_id, event in events.items():
+            self.add(event_id, event)
+        return self
+
+    def add(self, event_id, event):
+        """Queue the event's location unless it is already resolved. Never blocks."""
+        self.remove(event_id)
+        location = (event.get('location') or '').strip()
+        if not location or event_coordinates(event):
+            return
+        key = location_key(location)
+        with self._lock:
+            self._waiting.setdefault(key, {})[event_id] = event['location']
+            self._key_of[event_id] = key
+            jobs = self._take([key])
+        self._submit(jobs)
+
+    def remove(self, event_id):
+        with self._lock:
+            self._forget(event_id)
+
+    def _forget(self, event_id):
+        key = self._key_of.pop(event_id, None)
+        if key is None:
+            return
+        waiting = self._waiting[key]
+        del waiting[event_id]
+        if not waiting:
+            del self._waiting[key]
+
+    def _take(self, keys):
+        """Mark waiting keys as queued and return their ``(key, location)`` jobs. Call with _lock held.
+
+        Returns nothing unless this process runs lookups. A process that
+        just took over takes every waiting key.
+        """
+        if self._leader is None:
+            now = time.monotonic()
+            if now < self._next_claim:
+                return []
+            self._next_claim = now + CLAIM_INTERVAL
+            self._leader = try_lock_file(self.lock_file)
+            if self._leader is None:
+                return []
+            keys = list(self._waiting)
+        jobs = []
+        for key in keys:
+            if key in self._queued or key in self.failures or key not in self._waiting:
+                continue
+            self._queued.add(key)
+            jobs.append((key, next(iter(self._waiting[key].values()))))
+        return jobs
+
+    def _submit(self, jobs):
+        for key, location in jobs:
+            self._executor.submit(self._resolve, key, location)
+
+    def retry_failed(self):
+        """Queue every failed location again."""
+        with self._lock:
+            keys = [key for key in self.failures if key in self._waiting]
+            self.failures.clear()
+            jobs = self._take(keys)
+        self._submit(jobs)
+        return len(jobs)
+
+    def status(self):
+        """Counts for the admin view: waiting events and locations, plus lifetime stats."""
+        with self._lock:
+            jobs = self._take([])
+            pending = [key for key in self._waiting if key not in self.failures]
+            status = {
+                **self.stats,
+                "pending_locations": len(pending),
+                "pending_events": sum(len(self._waiting[key]) for key in pending),
+                "failed_locations": len(self.failures),
+                "leader": self._leader is not None,
+            }
+        self._submit(jobs)
+        return status
+
+    def _throttle(self):
+        while True:
+            with self._bucket_lock:
+                wait = self.bucket.acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def _resolve(self, key, location):
+        coords = None
+        try:
+            with self._lock:
+                if not self._waiting.get(key):
+                    return
+                coords = self._resolved.get(key)
+            if coords is None:
+                coords = self._lookup(key, location)
+        finally:
+            with self._lock:
+                if coords is None:
+                    self._queued.discard(key)
+                else:
+                    # The key stays queued until the batch holding it is saved
+                    self._unsaved[key] = location
+                    if self._saver is None:
+                        self._saver = threading.Timer(SAVE_INTERVAL, self._save)
+                        self._saver.daemon = True
+                        self._saver.start()
+
+    def _lookup(self, key, location):
+        self._throttle()
+        try:
+            coords = self.geocode(location)
+        except Exception as e:
+            logging.error(f"Failed to geocode {location}: {str(e)}")
+            with self._lock:
+                self.stats["failed"] += 1
+                self.failures[key] = str(e)
+            return None
+
+        with self._lock:
+            if coords is None:
+                self.stats["not_found"] += 1
+                self.failures[key] = "No match found"
+            else:
+                self.stats["resolved"] += 1
+                self._resolved[key] = coords
+        return coords
+
+    def _save(self):
+        """Write the coordinates of every unsaved location in one transaction."""
+        with self._lock:
+            batch, self._unsaved = self._unsaved, {}
+            self._saver = None
+            event_ids = {key: list(self._waiting.get(key, ())) for key in batch}
+            coords = {key: self._resolved[key] for key in batch}
+        try:
+            with self.store.transaction() as tx:
+                for key, ids in event_ids.items():
+                    lat, lon = coords[key]
+                    for event_id in ids:
+                        # Read inside the transaction so no concurrent edit is overwritten
+                        event = self.store.data['events'].get(event_id)
+                        if event is None or event_coordinates(event):
+                            continue
+                        tx.put('events', event_id, {
+                            **event, 'geo': {'query': event.get('location'), 'lat': lat, 'lon': lon},
+                        })
+            if not tx.ok:
+                raise RuntimeError("store save failed")
+        except Exception as e:
+            logging.error(f"Failed to save coordinates for {len(batch)} location(s): {str(e)}")
+            with self._lock:
+                for key in batch:
+                    self.failures[key] = str(e)
+                self._queued.difference_update(batch)
+            return
+
+        with self._lock:
+            for key, ids in event_ids.items():
+                for event_id in ids:
+                    if self._key_of.get(event_id) == key:
+                        self._forget(event_id)
+            self._queued.difference_update(batch)
+            # Events added while the batch was being saved still need their coordinates
+            jobs = [(key, location) for key, location in batch.items() if self._waiting.get(key)]
+            self._queued.update(key for key, _ in jobs)
+        self._submit(jobs)
@@ -0,0 +1,284 @@
+import bisect
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from event_index import parse_event_start
+
+# --- Constants --- #
+LEVELS = ('day', 'week', 'month')
+# Upper bounds, in whole days before the event starts, of each lead-time bucket
+LEAD_BOUNDS = (0, 3, 7, 14, 30)
+LEAD_LABELS = ('Same day', '1-3 days', '4-7 days', '8-14 days', '15-30 days', '31+ days')
+UNKNOWN_LOCATION = 'Unknown'
+# Layout of a cell's counters: events, capacity, registered, then one per lead-time bucket
+EVENTS, CAPACITY, REGISTERED, LEADS = 0, 1, 2, 3
+
+
+def lead_bucket(lead_days):
+    """Index into LEAD_LABELS for a registration made lead_days before its event."""
+    return bisect.bisect_left(LEAD_BOUNDS, max(lead_days, 0))
+
+
+def event_periods(start):
+    """The day, week and month an event starting at start falls in, by level."""
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        'day': day,
+        'week': day - timedelta(days=day.weekday()),
+        'month': day.replace(day=1),
+    }
+
+
+def _parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+class _StoreView:
+    """Lets SharedStore.watch() feed one store into the cube."""
+
+    def __init__(self, add, remove):
+        self.add = add
+        self.remove = remove
+
+
+# --- Cube --- #
+class OccupancyCube:
+    """Capacity, registrations and lead times by location, period and event.
+
+    The finest cell is one event, which has one location and one start
+    day. Running totals per (period, location) are kept for the day, week
+    and month levels and every change adjusts them by its delta, so
+    neither an edited event nor a new sign-up rescans the stores. Query
+    results are built from those totals and kept until the next change.
+
+    Feed it with ``store.watch('events', cube.watch_events)`` and
+    ``store.watch('registrations', cube.watch_registrations)``.
+    """
+
+    def __init__(self):
+        self._events = {}
+        # event_id -> {reg_id: registration time}, kept to recount lead times when an event moves
+        self._reg_times = {}
+        self._event_of = {}
+        self._leads = {}
+        # level -> {(period, location): counters laid out as EVENTS, CAPACITY, REGISTERED, LEADS...}
+        self._cells = {level: {} for level in LEVELS}
+        # level -> {period: {location: {event_id: None}}}
+        self._members = {level: {} for level in LEVELS}
+        self._results = {}
+
+    # Bulk loading
+    def watch_events(self, events):
+        for event_id, event in events.items():
+            self._set_event(event_id, event)
+        self._rebuild()
+        return _StoreView(self.add_event, self.remove_event)
+
+    def watch_registrations(self, registrations):
+        """Count existing registrations with one vectorized pass."""
+        if registrations:
+            reg_ids = list(registrations)
+            event_ids = pd.Series([r['event_id'] for r in registrations.values()])
+            timestamps = pd.to_datetime(pd.Series([r.get('timestamp') for r in registrations.values()]),
+                                        errors='coerce', format='mixed')
+            parsed = timestamps.notna().to_numpy()
+            times = np.where(parsed, timestamps.dt.to_pydatetime(), None)
+            for reg_id, event_id, timestamp in zip(reg_ids, event_ids, times):
+                self._event_of[reg_id] = event_id
+                self._reg_times.setdefault(event_id, {})[reg_id] = timestamp
+
+            starts = event_ids.map(pd.Series({eid: e['start'] for eid, e in self._events.items()}, dtype='datetime64[ns]'))
+            known = parsed & starts.notna().to_numpy()
+            lead_days = (starts[known] - timestamps[known]).dt.days.clip(lower=0)
+            buckets = np.searchsorted(LEAD_BOUNDS, lead_days.to_numpy(), side='left')
+            counts = pd.Series(1, index=pd.MultiIndex.from_arrays(
+                [event_ids[known].to_numpy(), buckets])).groupby(level=[0, 1]).sum()
+            for (event_id, bucket), count in counts.items():
+                self._leads.setdefault(event_id, [0] * len(LEAD_LABELS))[bucket] += int(count)
+        self._rebuild()
+        return _StoreView(self.add_registration, self.remove_registration)
+
+    def _rebuild(self):
+        for level in LEVELS:
+            self._cells[level].clear()
+            self._members[level].clear()
+        for event_id in self._events:
+            self._place(event_id, 1)
+        self._results.clear()
+
+    # Incremental updates
+    def add_event(self, event_id, event):
+        """Insert or update an event, recounting its lead times if it moved."""
+        previous = self._events.get(event_id)
+        if previous is not None:
+            self._place(event_id, -1)
+        self._set_event(event_id, event)
+        if self._events[event_id]['start'] != (previous or {}).get('start'):
+            self._recount_leads(event_id)
+        self._place(event_id, 1)
+        self._results.clear()
+
+    def remove_event(self, event_id):
+        """Drop an event. Its registrations are counted again if it comes back."""
+        if event_id in self._events:
+            self._place(event_id, -1)
+            del self._events[event_id]
+            self._leads.pop(event_id, None)
+            self._results.clear()
+
+    def add_registration(self, reg_id, registration):
+        """Count a registration against its event."""
+        self.remove_registration(reg_id)
+        event_id = registration['event_id']
+        timestamp = _parse_timestamp(registration.get('timestamp'))
+        self._event_of[reg_id] = event_id
+        self._reg_times.setdefault(event_id, {})[reg_id] = timestamp
+        self._count_registration(event_id, timestamp, 1)
+
+    def remove_registration(self, reg_id):
+        """Uncount a registration. Unknown ids are ignored."""
+        event_id = self._event_of.pop(reg_id, None)
+        if event_id is None:
+            return
+        times = self._reg_times[event_id]
+        timestamp = times.pop(reg_id)
+        if not times:
+            del self._reg_times[event_id]
+        self._count_registration(event_id, timestamp, -1)
+
+    def _set_event(self, event_id, event):
+        start = parse_event_start(event)
+        self._events[event_id] = {
+            'name': event.get('name', ''),
+            'location': (event.get('location') or '').strip() or UNKNOWN_LOCATION,
+            'start': start,
+            'capacity': event.get('capacity', 0),
+            'periods': event_periods(start) if start is not None else {},
+        }
+
+    def _place(self, event_id, sign):
+        """Add a dated event's counters to its cells (sign 1) or take them out again (sign -1)."""
+        event = self._events[event_id]
+        counters = [1, event['capacity'], len(self._reg_times.get(event_id, ())),
+                    *self._leads.get(event_id, [0] * len(LEAD_LABELS))]
+        location = event['location']
+        for level, period in event['periods'].items():
+            cell = self._cells[level].setdefault((period, location), [0] * len(counters))
+            for i, count in enumerate(counters):
+                cell[i] += sign * count
+            by_location = self._members[level].setdefault(period, {})
+            members = by_location.setdefault(location, {})
+            if sign > 0:
+                members[event_id] = None
+                continue
+            del members[event_id]
+            if not members:
+                del self._cells[level][(period, location)]
+                del by_location[location]
+                if not by_location:
+                    del self._members[level][period]
+
+    def _count_registration(self, event_id, timestamp, delta):
+        bucket = self._count_lead(event_id, timestamp, delta)
+        event = self._events.get(event_id)
+        if event is not None:
+            for level, period in event['periods'].items():
+                cell = self._cells[level][(period, event['location'])]
+                cell[REGISTERED] += delta
+                if bucket is not None:
+                    cell[LEADS + bucket] += delta
+        self._results.clear()
+
+    def _count_lead(self, event_id, timestamp, delta):
+        """Count a registration in its event's lead-time bucket and return the bucket, if both times are known."""
+        start = self._events.get(event_id, {}).get('start')
+        if start is None or timestamp is None:
+            return None
+        bucket = lead_bucket((start - timestamp).days)
+        self._leads.setdefault(event_id, [0] * len(LEAD_LABELS))[bucket] += delta
+        return bucket
+
+    def _recount_leads(self, event_id):
+        self._leads.pop(event_id, None)
+        for timestamp in self._reg_times.get(event_id, {}).values():
+            self._count_lead(event_id, timestamp, 1)
+
+    # Queries
+    def rollup(self, level='month', by_location=True):
+        """Totals per period (and location): events, capacity, registered and fill rate in percent."""
+        if level not in LEVELS:
+            raise ValueError(f"Unknown level {level!r}")
+        key = ('rollup', level, by_location)
+        totals = self._results.get(key)
+        if totals is None:
+            sums = {}
+            for (period, location), cell in self._cells[level].items():
+                row = sums.setdefault((period, location) if by_location else (period,), [0, 0, 0])
+                row[EVENTS] += cell[EVENTS]
+                row[CAPACITY] += cell[CAPACITY]
+                row[REGISTERED] += cell[REGISTERED]
+            keys = sorted(sums)
+            totals = pd.DataFrame(keys, columns=[level, 'location'] if by_location else [level])
+            counts = np.array([sums[k] for k in keys], dtype='int64').reshape(len(keys), 3)
+            totals['events'] = counts[:, EVENTS]
+            totals['capacity'] = counts[:, CAPACITY]
+            totals['registered'] = counts[:, REGISTERED]
+            totals['fill_rate'] = (totals['registered'] / totals['capacity'].where(totals['capacity'] > 0) * 100).fillna(0)
+            self._results[key] = totals
+        return totals
+
+    def events_in(self, level, period, location=None):
+        """Event rows for one period cell, optionally limited to a location."""
+        period = pd.Timestamp(period).to_pydatetime()
+        key = ('events_in', level, period, location)
+        rows = self._results.get(key)
+        if rows is None:
+            by_location = self._members[level].get(period, {})
+            groups = by_location.values() if location is None else [by_location.get(location, {})]
+            event_ids = [event_id for members in groups for event_id in members]
+            events = [self._events[event_id] for event_id in event_ids]
+            rows = pd.DataFrame({
+                'event_id': event_ids,
+                'name': [e['name'] for e in events],
+                'location': [e['location'] for e in events],
+                'start': pd.to_datetime([e['start'] for e in events]),
+                'capacity': np.array([e['capacity'] for e in events], dtype='int64'),
+                'registered': np.array([len(self._reg_times.get(eid, ())) for eid in event_ids], dtype='int64'),
+            })
+            self._results[key] = rows
+        return rows
+
+    def lead_times(self, location=None, level=None, period=None):
+        """Registrations per lead-time bucket, optionally for one location and period."""
+        if level is None or period is None:
+            # Every dated event sits in exactly one month cell
+            level, period = 'month', None
+        else:
+            period = pd.Timestamp(period).to_pydatetime()
+        key = ('lead_times', location, level, period)
+        totals = self._results.get(key)
+        if totals is None:
+            counts = [0] * len(LEAD_LABELS)
+            for (cell_period, cell_location), cell in self._cells[level].items():
+                if location is not None and cell_location != location:
+                    continue
+                if period is not None and cell_period != period:
+                    continue
+                for i, count in enumerate(cell[LEADS:]):
+                    counts[i] += count
+            totals = pd.DataFrame({'lead_time': list(LEAD_LABELS), 'registrations': counts})
+            self._results[key] = totals
+        return totals
+
+    def locations(self):
+        """Locations with at least one dated event, alphabetically."""
+        locations = self._results.get('locations')
+        if locations is None:
+            locations = sorted({location for _, location in self._cells['month']})
+            self._results['locations'] = locations
+        return locations
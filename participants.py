@@ -0,0 +1,90 @@
+import csv
+import io
+
+from search_index import fold_text
+
+# --- Constants --- #
+PAGE_SIZE = 25
+SORT_FIELDS = ('name', 'email', 'timestamp')
+CSV_COLUMNS = ('name', 'email', 'phone', 'timestamp')
+
+
+# --- Index --- #
+class ParticipantIndex:
+    """Registrations grouped by event id.
+
+    Looking up an event's participants is a dict access instead of a scan
+    over every registration in the store.
+    """
+
+    def __init__(self, registrations=None):
+        self._by_event = {}
+        self._event_of = {}
+        for reg_id, registration in (registrations or {}).items():
+            self.add(reg_id, registration)
+
+    def add(self, reg_id, registration):
+        """Index a registration under its event."""
+        self.remove(reg_id)
+        event_id = registration['event_id']
+        self._by_event.setdefault(event_id, {})[reg_id] = registration
+        self._event_of[reg_id] = event_id
+
+    def remove(self, reg_id):
+        """Drop a single registration. Unknown ids are ignored."""
+        event_id = self._event_of.pop(reg_id, None)
+        if event_id is None:
+            return
+        event_regs = self._by_event[event_id]
+        del event_regs[reg_id]
+        if not event_regs:
+            del self._by_event[event_id]
+
+    def registration_ids(self, event_id):
+        """Return the ids of the event's registrations."""
+        return list(self._by_event.get(event_id, ()))
+
+    def count(self, event_id):
+        """Number of registrations for an event."""
+        return len(self._by_event.get(event_id, ()))
+
+    def for_event(self, event_id):
+        """Return the event's registrations in registration order."""
+        return list(self._by_event.get(event_id, {}).values())
+
+
+# --- Paging and export --- #
+def query_participants(participants, search='', sort_by='timestamp', descending=False,
+                       page=1, page_size=PAGE_SIZE, registered_from=None, registered_to=None):
+    """Filter, sort and slice participants.
+
+    registered_from and registered_to are dates, both inclusive. Returns
+    ``(rows, total)`` where rows is only the requested page and total is
+    the number of participants matching the filter.
+    """
+    if registered_from or registered_to:
+        # Timestamps are ISO strings, so their first ten characters compare as dates
+        low = registered_from.isoformat() if registered_from else ''
+        high = registered_to.isoformat() if registered_to else '9999-12-31'
+        participants = [p for p in participants if low <= str(p.get('timestamp', ''))[:10] <= high]
+    if search:
+        needle = fold_text(search)
+        participants = [
+            p for p in participants
+            if needle in fold_text(p.get('name', '')) or needle in fold_text(p.get('email', ''))
+        ]
+    if sort_by not in SORT_FIELDS:
+        sort_by = 'timestamp'
+    participants = sorted(participants, key=lambda p: fold_text(p.get(sort_by, '')), reverse=descending)
+
+    start = (max(page, 1) - 1) * page_size
+    return participants[start:start + page_size], len(participants)
+
+
+def participants_csv(participants):
+    """Return the participant list as CSV text."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    writer.writerows([p.get(column, '') for column in CSV_COLUMNS] for p in participants)
+    return buffer.getvalue()
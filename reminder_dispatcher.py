@@ -0,0 +1,242 @@
+import heapq
+import itertools
+import logging
+import random
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+
+# --- Constants --- #
+# Defaults sit below Gmail's sending limits for a regular account
+RATE_PER_MINUTE = 20
+BURST_SIZE = 5
+DAILY_QUOTA = 450
+
+# Lower number is sent first when several reminders are due
+PRIORITIES = {
+    "1-hour": 0,
+    "24-hour": 1,
+}
+
+# Reminders are spread randomly over this window after their nominal time
+DELIVERY_WINDOWS = {
+    "1-hour": timedelta(minutes=5),
+    "24-hour": timedelta(minutes=30),
+}
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 60  # seconds, doubled on every attempt
+THROTTLE_PAUSE = 300  # seconds to back off when the provider pushes back
+
+# SMTP replies meaning "slow down" rather than "this message is bad"
+THROTTLE_CODES = {421, 450, 451, 452, 454}
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        """Take tokens if available. Returns 0, or the seconds to wait before retrying."""
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0
+        return (tokens - self.tokens) / self.rate
+
+
+class ReminderDispatcher:
+    """Background sender that smooths reminder bursts into a steady stream.
+
+    Submitted reminders first wait in a heap ordered by their jittered
+    send time. Once due they move to a ready heap ordered by priority, so
+    1-hour reminders overtake 24-hour ones. A token bucket caps the
+    per-minute rate and a daily counter defers sending to the next day
+    once the quota is used up. Reminders that can no longer arrive before
+    their deadline are dropped instead of being sent late.
+    """
+
+    def __init__(self, send_func, rate_per_minute=RATE_PER_MINUTE, burst=BURST_SIZE,
+                 daily_quota=DAILY_QUOTA, clock=datetime.now, rng=None, sent_today=0):
+        self.send_func = send_func
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self.daily_quota = daily_quota
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.stats = {"queued": 0, "sent": 0, "retried": 0, "failed": 0, "expired": 0, "deferred": 0}
+
+        self._delayed = []  # (send_at, seq, job)
+        self._ready = []  # (priority, send_at, seq, job)
+        self._seq = itertools.count()
+        # Seeded with what earlier runs sent today, so a restart doesn't reset the quota
+        self._day = clock().date()
+        self._sent_today = sent_today
+        self._paused_until = None
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    # --- Public API --- #
+    def submit(self, recipient, event_data, when, deadline=None, on_sent=None):
+        """Queue a reminder, jittered within the delivery window for `when`.
+
+        `on_sent` is called without arguments once the message was accepted.
+        """
+        window = DELIVERY_WINDOWS.get(when, timedelta(0))
+        now = self.clock()
+        send_at = now + window * self.rng.random()
+        if deadline is not None:
+            send_at = min(send_at, max(now, deadline - timedelta(minutes=1)))
+
+        job = {
+            "recipient": recipient,
+            "event": event_data,
+            "when": when,
+            "deadline": deadline,
+            "attempts": 0,
+            "on_sent": on_sent,
+        }
+        with self._cond:
+            heapq.heappush(self._delayed, (send_at, next(self._seq), job))
+            self.stats["queued"] += 1
+            self._cond.notify()
+
+    def start(self):
+        """Start the worker thread if it isn't running yet."""
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="reminder-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the worker thread. Queued reminders are kept in memory."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def pending(self):
+        """Number of reminders waiting to be sent."""
+        with self._cond:
+            return len(self._delayed) + len(self._ready) + self._in_flight
+
+    def wait_idle(self, timeout=None):
+        """Block until the queue drains. Returns False on timeout."""
+        end = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if end is not None and time.monotonic() >= end:
+                return False
+            time.sleep(0.05)
+        return True
+
+    # --- Worker --- #
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                job, wait = self._next_job()
+                if job is None:
+                    self._cond.wait(wait)
+                    continue
+                self._in_flight += 1
+            try:
+                self._deliver(job)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+
+    def _next_job(self):
+        """Pick the next job to send, or return how long to sleep. Caller holds the lock."""
+        now = self.clock()
+        while self._delayed and self._delayed[0][0] <= now:
+            send_at, seq, job = heapq.heappop(self._delayed)
+            heapq.heappush(self._ready, (PRIORITIES.get(job["when"], len(PRIORITIES)), send_at, seq, job))
+
+        next_due = (self._delayed[0][0] - now).total_seconds() if self._delayed else None
+        if not self._ready:
+            return None, next_due
+
+        # Drop reminders that could only arrive after their event started
+        while self._ready and self._ready[0][3]["deadline"] is not None and now >= self._ready[0][3]["deadline"]:
+            job = heapq.heappop(self._ready)[3]
+            self.stats["expired"] += 1
+            logging.warning(f"Dropping {job['when']} reminder for {job['recipient']}: event already started")
+        if not self._ready:
+            return None, next_due
+
+        if self._paused_until and now < self._paused_until:
+            return None, (self._paused_until - now).total_seconds()
+
+        if self._day != now.date():
+            self._day = now.date()
+            self._sent_today = 0
+        if self._sent_today >= self.daily_quota:
+            self.stats["deferred"] += 1
+            midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            self._paused_until = midnight
+            logging.warning(f"Daily email quota reached, deferring {len(self._ready)} reminders until {midnight}")
+            return None, (midnight - now).total_seconds()
+
+        wait = self.bucket.acquire()
+        if wait:
+            return None, wait
+
+        job = heapq.heappop(self._ready)[3]
+        self._sent_today += 1
+        return job, None
+
+    def _deliver(self, job):
+        job["attempts"] += 1
+        try:
+            ok = self.send_func(job["recipient"], job["event"], job["when"])
+            error = None
+        except Exception as e:
+            ok = False
+            error = e
+
+        if ok:
+            self.stats["sent"] += 1
+            if job["on_sent"]:
+                try:
+                    job["on_sent"]()
+                except Exception as e:
+                    # Don't let a failing callback kill the worker thread
+                    logging.error(f"Delivery callback failed for {job['recipient']}: {str(e)}")
+            return
+
+        now = self.clock()
+        with self._cond:
+            if isinstance(error, smtplib.SMTPResponseException) and error.smtp_code in THROTTLE_CODES:
+                # The provider is throttling us, back off everything and don't count an attempt
+                job["attempts"] -= 1
+                self._paused_until = now + timedelta(seconds=THROTTLE_PAUSE)
+                logging.warning(f"SMTP server throttled sending ({error.smtp_code}), pausing for {THROTTLE_PAUSE}s")
+                retry_at = self._paused_until
+            elif job["attempts"] < MAX_ATTEMPTS:
+                retry_at = now + timedelta(seconds=RETRY_DELAY * 2 ** (job["attempts"] - 1))
+                logging.warning(f"Failed to send {job['when']} reminder to {job['recipient']}, retrying at {retry_at}: {error}")
+            else:
+                self.stats["failed"] += 1
+                logging.error(f"Giving up on {job['when']} reminder for {job['recipient']} after {job['attempts']} attempts: {error}")
+                return
+
+            self.stats["retried"] += 1
+            heapq.heappush(self._delayed, (retry_at, next(self._seq), job))
+            self._cond.notify()
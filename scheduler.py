@@ -6,18 +6,25 @@ except ImportError:
     raise
 
 from datetime import datetime, timedelta
-import json
+import os
 import uuid
 import logging
 import smtplib
+from functools import partial
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from event_index import EventTimeline, parse_event_start
+from reminder_dispatcher import ReminderDispatcher
+from delivery_ledger import DeliveryLedger
+from serialization import load_store
 
 # --- Constants --- #
 EVENTS_FILE = 'events.json'
 REGISTRATIONS_FILE = 'registrations.json'
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
+# Point these at a local SMTP stand-in (with SMTP_USE_TLS=0) when testing
+SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
+SMTP_USE_TLS = os.environ.get("SMTP_USE_TLS", "1") != "0"
 SENDER_EMAIL = "your-email@gmail.com"  # Replace with your Gmail
 SENDER_PASSWORD = "your-app-password"   # Replace with your app password
 
@@ -43,51 +50,46 @@ Event Management Team
 def load_events():
     """Load events from the events file."""
     try:
-        with open(EVENTS_FILE, 'r') as f:
-            return json.load(f)
+        return load_store(EVENTS_FILE)
     except FileNotFoundError:
         return {}
 
 
-def send_reminder_email(recipient_email, event_data, when):
-    """Send reminder email to participant."""
-    try:
-        message = MIMEMultipart()
-        message["From"] = SENDER_EMAIL
-        message["To"] = recipient_email
-        message["Subject"] = f"Reminder: {event_data['name']} is {when} away!"
-
-        body = REMINDER_EMAIL_TEMPLATE.format(
-            event_name=event_data['name'],
-            when=when,
-            event_date=event_data['date'],
-            event_time=event_data.get('time', 'TBD'),
-            event_location=event_data.get('location', 'TBD')
-        )
+def deliver_reminder_email(recipient_email, event_data, when):
+    """Send reminder email to participant, raising on SMTP errors."""
+    message = MIMEMultipart()
+    message["From"] = SENDER_EMAIL
+    message["To"] = recipient_email
+    message["Subject"] = f"Reminder: {event_data['name']} is {when} away!"
 
-        message.attach(MIMEText(body, "plain"))
+    body = REMINDER_EMAIL_TEMPLATE.format(
+        event_name=event_data['name'],
+        when=when,
+        event_date=event_data['date'],
+        event_time=event_data.get('time', 'TBD'),
+        event_location=event_data.get('location', 'TBD')
+    )
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+    message.attach(MIMEText(body, "plain"))
+
+    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+        if SMTP_USE_TLS:
             server.starttls()
             server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.send_message(message)
-        return True
-    except Exception as e:
-        logging.error(f"Failed to send reminder email: {str(e)}")
-        return False
+        server.send_message(message)
+    return True
 
 
 def load_registrations():
     """Load registrations from file."""
     try:
-        with open(REGISTRATIONS_FILE, 'r') as f:
-            return json.load(f)
+        return load_store(REGISTRATIONS_FILE)
     except FileNotFoundError:
         return {}
 
 
 def reminder_callback(event_id, when):
-    """Send reminder emails to all registered participants."""
+    """Queue reminder emails to all registered participants."""
     events = load_events()
     registrations = load_registrations()
     
@@ -95,42 +97,67 @@ def reminder_callback(event_id, when):
     if not event:
         return
 
-    # Get all registrations for this event
+    # Get registrations for this event that haven't received this reminder yet
     event_registrations = [
-        reg for reg in registrations.values()
-        if reg['event_id'] == event_id
+        (reg_id, reg) for reg_id, reg in registrations.items()
+        if reg['event_id'] == event_id and not ledger.has(event_id, when, reg_id)
     ]
 
-    # Send reminder to each registered participant
-    for registration in event_registrations:
-        send_reminder_email(registration['email'], event, when)
+    # Hand each reminder to the dispatcher, which paces them under the provider's limits
+    deadline = parse_event_start(event)
+    for reg_id, registration in event_registrations:
+        dispatcher.submit(
+            registration['email'], event, when,
+            deadline=deadline,
+            on_sent=partial(ledger.record, event_id, when, reg_id)
+        )
 
 
 # --- Scheduler Functions --- #
-def schedule_reminders(scheduler, event_id, event_date_str):
-    """Schedule reminders for an event."""
+def schedule_reminders(scheduler, event_id, event_date_str, catch_up=False):
+    """Schedule reminders for an event.
+
+    With catch_up, a reminder whose time already passed while the event is
+    still ahead is run right away; the delivery ledger makes sure only
+    recipients that didn't get it yet are mailed.
+    """
     # Parse the event date
     event_date = datetime.fromisoformat(event_date_str)
+    now = datetime.now()
+    missed = None
 
     # 24-hour-before reminder
     reminder_1 = event_date - timedelta(days=1)
-    if reminder_1 > datetime.now():
+    if reminder_1 > now:
         scheduler.add_job(
             reminder_callback,
             trigger=DateTrigger(run_date=reminder_1),
             args=[event_id, "24-hour"],
             id=f"{event_id}_reminder1"
         )
+    elif event_date > now:
+        missed = "24-hour"
 
     # 1-hour-before reminder
     reminder_2 = event_date - timedelta(hours=1)
-    if reminder_2 > datetime.now():
+    if reminder_2 > now:
         scheduler.add_job(
             reminder_callback,
             trigger=DateTrigger(run_date=reminder_2),
             args=[event_id, "1-hour"],
             id=f"{event_id}_reminder2"
         )
+    elif event_date > now:
+        missed = "1-hour"
+
+    # Only the latest missed reminder is still worth sending
+    if catch_up and missed:
+        scheduler.add_job(
+            reminder_callback,
+            trigger=DateTrigger(run_date=now),
+            args=[event_id, missed],
+            id=f"{event_id}_catchup"
+        )
 
 
 def init_scheduler():
@@ -138,16 +165,20 @@ def init_scheduler():
     scheduler = BackgroundScheduler()
     scheduler.start()
 
-    # On startup, reschedule reminders for all future events
-    events = load_events()
-    for event_id, ev in events.items():
-        schedule_reminders(scheduler, event_id, ev['date'])
+    # On startup, reschedule reminders for future events only and resume any
+    # fan-out the previous process didn't finish
+    timeline = EventTimeline(load_events())
+    for event_id in timeline.upcoming():
+        schedule_reminders(scheduler, event_id, timeline.start_of(event_id).isoformat(), catch_up=True)
 
     return scheduler
 
 
 # --- Event Handling --- #
 # expose a function to call when you create a new event
+ledger = DeliveryLedger()
+dispatcher = ReminderDispatcher(deliver_reminder_email, sent_today=ledger.count_sent_on(datetime.now().date()))
+dispatcher.start()
 scheduler = init_scheduler()
 
 
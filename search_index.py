@@ -0,0 +1,183 @@
+import bisect
+import heapq
+import re
+import unicodedata
+
+# --- Constants --- #
+# Matches in the name count more than matches in the location or description
+FIELD_WEIGHTS = {
+    'name': 3,
+    'location': 2,
+    'desc': 1,
+}
+
+# Words, plus emoji and other pictographs as one token each
+TOKEN_PATTERN = re.compile(r"\w+|[\u2600-\u27bf\U0001f000-\U0001faff]")
+COMBINING_MARKS = re.compile(r"[\u0300-\u036f]")
+
+# Shorter query terms only match whole words, so one or two typed letters
+# don't expand to most of the vocabulary
+MIN_PREFIX_LENGTH = 3
+# Added to a term's weight when the indexed word equals it rather than extends it
+EXACT_BONUS = 1
+
+
+# --- Tokenization --- #
+def fold_text(text):
+    """Lowercase text and strip accents so 'Parañaque' matches 'paranaque'."""
+    text = str(text)
+    if text.isascii():
+        return text.lower()
+    return COMBINING_MARKS.sub('', unicodedata.normalize('NFKD', text.casefold()))
+
+
+def tokenize(text):
+    """Split mixed Filipino/English text into word and emoji tokens."""
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(fold_text(text))
+
+
+# --- Index --- #
+class EventSearchIndex:
+    """Inverted index over event name, description and location.
+
+    Postings map each term to ``{event_id: weight}``, and impacts group the
+    same events by weight so a term's best matches can be walked first. A
+    sorted copy of the vocabulary is kept so every query term can be
+    matched as a prefix with a binary search, which keeps
+    typing-as-you-search responsive.
+    """
+
+    def __init__(self, events=None):
+        self._postings = {}
+        self._impacts = {}  # term -> {weight: {event_id: None}}
+        self._terms = []
+        self._event_terms = {}
+        for event_id, event in (events or {}).items():
+            self.add(event_id, event)
+
+    def __len__(self):
+        return len(self._event_terms)
+
+    def __contains__(self, event_id):
+        return event_id in self._event_terms
+
+    def add(self, event_id, event):
+        """Index an event, replacing any previous entry for the same id."""
+        self.remove(event_id)
+
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(event.get(field, '')):
+                weights[term] = weights.get(term, 0) + weight
+
+        for term, weight in weights.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = {}
+                self._impacts[term] = {}
+                bisect.insort(self._terms, term)
+            posting[event_id] = weight
+            self._impacts[term].setdefault(weight, {})[event_id] = None
+        self._event_terms[event_id] = set(weights)
+
+    def remove(self, event_id):
+        """Drop an event from the index. Unknown ids are ignored."""
+        for term in self._event_terms.pop(event_id, ()):
+            posting = self._postings[term]
+            impacts = self._impacts[term]
+            weight = posting.pop(event_id)
+            del impacts[weight][event_id]
+            if not impacts[weight]:
+                del impacts[weight]
+            if not posting:
+                del self._postings[term]
+                del self._impacts[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _sources(self, term):
+        """Return ``{indexed_term: bonus}`` for the indexed words a query term matches."""
+        if len(term) < MIN_PREFIX_LENGTH:
+            return {term: EXACT_BONUS} if term in self._postings else {}
+        sources = {}
+        i = bisect.bisect_left(self._terms, term)
+        while i < len(self._terms) and self._terms[i].startswith(term):
+            # Exact matches rank above matches on a longer word
+            sources[self._terms[i]] = EXACT_BONUS if self._terms[i] == term else 0
+            i += 1
+        return sources
+
+    def _ranked(self, sources):
+        """Yield ``(score, event_id)`` for every event a term matches, best first."""
+        levels = {}
+        for indexed_term, bonus in sources.items():
+            for weight, events in self._impacts[indexed_term].items():
+                levels.setdefault(weight + bonus, []).append(events)
+        seen = set() if len(sources) > 1 else None
+        for score in sorted(levels, reverse=True):
+            for events in levels[score]:
+                for event_id in events:
+                    if seen is not None:
+                        if event_id in seen:
+                            continue
+                        seen.add(event_id)
+                    yield score, event_id
+
+    def _term_score(self, sources, event_id):
+        """Best weight plus bonus of the term on one event, 0 if it doesn't match."""
+        best = 0
+        event_terms = self._event_terms[event_id]
+        if len(sources) <= len(event_terms):
+            for indexed_term, bonus in sources.items():
+                weight = self._postings[indexed_term].get(event_id)
+                if weight is not None and weight + bonus > best:
+                    best = weight + bonus
+        else:
+            for indexed_term in event_terms:
+                bonus = sources.get(indexed_term)
+                if bonus is not None and self._postings[indexed_term][event_id] + bonus > best:
+                    best = self._postings[indexed_term][event_id] + bonus
+        return best
+
+    def search(self, query, limit=None, accept=None):
+        """Return ids of events matching every query term, best first.
+
+        Only ids for which ``accept(event_id)`` is true are returned when it
+        is given, so callers can filter before the limit applies.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        term_sources = [self._sources(term) for term in terms]
+        if not all(term_sources):
+            return []
+
+        # Walk the rarest term's events best first and score the other terms on each
+        term_sources.sort(key=lambda sources: sum(len(self._postings[t]) for t in sources))
+        lead, others = term_sources[0], term_sources[1:]
+        # The most the other terms can add, so the walk stops once no later event can rank higher
+        others_best = sum(
+            max(max(self._impacts[t]) + bonus for t, bonus in sources.items())
+            for sources in others
+        )
+
+        results = []  # (score, -rank, event_id), a min-heap of the best `limit` when limited
+        for rank, (score, event_id) in enumerate(self._ranked(lead)):
+            if limit and len(results) == limit and results[0][0] >= score + others_best:
+                break
+            for sources in others:
+                term_score = self._term_score(sources, event_id)
+                if not term_score:
+                    break
+                score += term_score
+            else:
+                if accept is not None and not accept(event_id):
+                    continue
+                if not limit:
+                    results.append((score, -rank, event_id))
+                elif len(results) < limit:
+                    heapq.heappush(results, (score, -rank, event_id))
+                elif (score, -rank) > results[0][:2]:
+                    heapq.heapreplace(results, (score, -rank, event_id))
+        return [event_id for _, _, event_id in sorted(results, reverse=True)]
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# --- Constants --- #
+# "json" keeps the data files as the source of truth, "msgpack" saves
+# compact binary snapshots next to them and only writes JSON on export
+SNAPSHOT_FORMAT = os.environ.get("STORE_SNAPSHOT_FORMAT", "json")
+SNAPSHOT_SUFFIX = ".msgpack"
+SNAPSHOT_CHUNK = 1000
+
+
+# --- Codecs --- #
+def dumps(data, pretty=False):
+    """Encode data as UTF-8 JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        # Same layout as orjson's OPT_INDENT_2, so files don't churn when it gets installed
+        return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def loads(raw):
+    """Decode JSON bytes or text, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def use_snapshots():
+    """Return True if saves should write binary snapshots."""
+    return SNAPSHOT_FORMAT == "msgpack" and msgpack is not None
+
+
+def snapshot_path(filename):
+    """Path of the binary snapshot kept next to a JSON data file."""
+    return os.path.splitext(filename)[0] + SNAPSHOT_SUFFIX
+
+
+def _write_atomic(path, chunks):
+    # Readers in other processes never see a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, path)
+
+
+# --- Snapshots --- #
+def write_snapshot(data, filename):
+    """Write a dict as a msgpack stream: the item count, then maps of up to SNAPSHOT_CHUNK items."""
+    packer = msgpack.Packer()
+    items = list(data.items())
+    def chunks():
+        yield packer.pack(len(items))
+        for start in range(0, len(items), SNAPSHOT_CHUNK):
+            yield packer.pack(dict(items[start:start + SNAPSHOT_CHUNK]))
+    _write_atomic(snapshot_path(filename), chunks())
+
+
+def read_snapshot(filename):
+    """Read a snapshot written by write_snapshot, one chunk at a time."""
+    with open(snapshot_path(filename), 'rb') as f:
+        unpacker = msgpack.Unpacker(f, raw=False)
+        count = next(unpacker)
+        data = {}
+        for chunk in unpacker:
+            if not isinstance(chunk, dict):
+                raise ValueError(f"Snapshot for {filename} has a malformed chunk")
+            data.update(chunk)
+    # A truncated file ends early instead of failing to parse
+    if not isinstance(count, int) or len(data) != count:
+        raise ValueError(f"Snapshot for {filename} is incomplete")
+    return data
+
+
+# --- Stores --- #
+def load_store(filename):
+    """Load a data file, preferring its binary snapshot when that is newer.
+
+    A corrupt snapshot falls back to the JSON file when there is one.
+    Raises FileNotFoundError if neither exists and ValueError if the
+    content can't be decoded.
+    """
+    if msgpack is not None:
+        try:
+            snapshot_mtime = os.path.getmtime(snapshot_path(filename))
+        except FileNotFoundError:
+            snapshot_mtime = None
+        try:
+            json_mtime = os.path.getmtime(filename)
+        except FileNotFoundError:
+            json_mtime = None
+        # An admin editing the JSON by hand makes it newer than the snapshot
+        if snapshot_mtime is not None and (json_mtime is None or snapshot_mtime >= json_mtime):
+            try:
+                return read_snapshot(filename)
+            except (StopIteration, ValueError, msgpack.UnpackException) as e:
+                if json_mtime is None:
+                    raise ValueError(f"Corrupt snapshot for {filename}") from e
+                logging.error(f"Corrupt snapshot for {filename}, loading the older JSON copy instead: {str(e)}")
+
+    with open(filename, 'rb') as f:
+        return loads(f.read())
+
+
+def save_store(data, filename):
+    """Save a data file in the configured format."""
+    if use_snapshots():
+        write_snapshot(data, filename)
+    else:
+        export_json(data, filename)
+
+
+def export_json(data, filename):
+    """Write the human-readable JSON copy of a store."""
+    _write_atomic(filename, [dumps(data, pretty=True)])
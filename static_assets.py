@@ -0,0 +1,77 @@
+import glob
+import hashlib
+import os
+import time
+
+# --- Constants --- #
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STYLE_SOURCE = os.path.join(APP_DIR, 'assets', 'style.css')
+# Streamlit serves this folder at app/static/ when server.enableStaticServing is on
+STATIC_DIR = os.path.join(APP_DIR, 'static')
+STATIC_URL = 'app/static'
+DIGEST_LENGTH = 12
+# Replicas still running older code keep linking to older builds, so only
+# builds beyond the newest few that are also this old get deleted
+KEEP_BUILDS = 5
+STALE_ASSET_AGE = 7 * 24 * 3600  # seconds
+
+
+def _publish(name, write):
+    """Create static/<name> with write(tmp_path) unless it exists, then prune old builds of the same asset."""
+    path = os.path.join(STATIC_DIR, name)
+    if not os.path.exists(path):
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        # Several app processes may build the same asset at once
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    else:
+        # Mark the build as in use again, so it ranks as recent
+        os.utime(path)
+    _prune(name.split('-', 1)[0])
+    return name
+
+
+def _prune(prefix):
+    """Delete builds of an asset that are neither among the newest KEEP_BUILDS nor recently used."""
+    builds = []
+    for build in glob.glob(os.path.join(STATIC_DIR, f"{prefix}-*")):
+        if build.endswith('.tmp'):
+            continue
+        try:
+            builds.append((os.path.getmtime(build), build))
+        except FileNotFoundError:
+            pass
+    cutoff = time.time() - STALE_ASSET_AGE
+    for mtime, build in sorted(builds, reverse=True)[KEEP_BUILDS:]:
+        if mtime < cutoff:
+            try:
+                os.remove(build)
+            except FileNotFoundError:
+                pass
+
+
+# --- Build steps --- #
+def build_stylesheet():
+    """Publish the app stylesheet under a content hash and return its CSS text and file name."""
+    with open(STYLE_SOURCE, 'r', encoding='utf-8') as f:
+        css = f.read()
+
+    data = css.encode('utf-8')
+    name = f"style-{hashlib.sha256(data).hexdigest()[:DIGEST_LENGTH]}.css"
+    def write(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+    return css, _publish(name, write)
+
+
+def page_style(static_serving):
+    """Markdown that applies the app stylesheet.
+
+    With static serving on this is a short link tag the browser fetches
+    and caches once; otherwise the CSS is inlined into the page.
+    """
+    css, name = build_stylesheet()
+    if static_serving:
+        return f'<link rel="stylesheet" href="{STATIC_URL}/{name}">'
+    return f"<style>\n{css}</style>"